@@ -1,37 +1,50 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 
 from app import (
-	RAG_RETRIEVER,
-	VECTORSTORE,
-	llm,
-	enhanced_past_paper,
-	create_rag_chain,
-	create_quiz_chain,
+	get_rag_chain,
+	get_quiz_chain,
+	get_enhanced_past_paper,
 )
+from response_cache import get_cached, set_cached
 
-app = FastAPI(title="Study Assistant API", version="1.0.0")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	"""Builds the shared chains once at startup so requests never pay the init cost."""
+	rag_chain, quiz_chain = get_rag_chain(), get_quiz_chain()
+	if not rag_chain or not quiz_chain:
+		raise RuntimeError("Vector store is not initialized. Run the indexing pipeline first.")
 
-if not RAG_RETRIEVER or not VECTORSTORE:
-	raise RuntimeError("Vector store is not initialized. Run the indexing pipeline first.")
+	app.state.rag_chain = rag_chain
+	app.state.quiz_chain = quiz_chain
+	app.state.past_paper = get_enhanced_past_paper()
+	yield
 
-RAG_CHAIN = create_rag_chain(llm, RAG_RETRIEVER)
-QUIZ_CHAIN = create_quiz_chain(llm, RAG_RETRIEVER)
+
+app = FastAPI(title="Study Assistant API", version="1.0.0", lifespan=lifespan)
+
+# Explicit origins (comma-separated in CORS_ORIGINS) instead of "*", and a long
+# max_age so browsers reuse the preflight result rather than re-sending OPTIONS.
+CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000").split(",")
 
 app.add_middleware(
 	CORSMiddleware,
-	allow_origins=["*"],
+	allow_origins=[origin.strip() for origin in CORS_ORIGINS if origin.strip()],
 	allow_credentials=True,
 	allow_methods=["*"],
 	allow_headers=["*"],
+	max_age=86400,
 )
 
 
@@ -62,6 +75,10 @@ class PastPaperAnswerRequest(BaseModel):
 	answer: str
 
 
+class PastPaperResponse(BaseModel):
+	response: str
+
+
 class QARequest(BaseModel):
 	sessionId: Optional[str] = "api"
 	message: str
@@ -73,8 +90,9 @@ class QuizRequest(BaseModel):
 
 
 @app.post("/api/pastpaper/start")
-def start_past_paper(req: PastPaperStartRequest):
-	if not enhanced_past_paper:
+async def start_past_paper(req: PastPaperStartRequest, request: Request) -> PastPaperResponse:
+	past_paper = request.app.state.past_paper
+	if not past_paper:
 		raise HTTPException(status_code=500, detail="Past paper flow unavailable. Index the data first.")
 
 	# Build a user message from provided fields if not given
@@ -82,50 +100,115 @@ def start_past_paper(req: PastPaperStartRequest):
 	if req.unitCode and req.year and not message:
 		message = f"Go through {req.unitCode} {req.year} past paper"
 
-	response = enhanced_past_paper.handle_past_paper_request(message, session_id=req.sessionId)
+	response = await asyncio.to_thread(past_paper.handle_past_paper_request, message, session_id=req.sessionId)
 	return {"response": response}
 
 
 @app.post("/api/pastpaper/continue")
-def continue_past_paper(req: PastPaperContinueRequest):
-	if not enhanced_past_paper:
+async def continue_past_paper(req: PastPaperContinueRequest, request: Request) -> PastPaperResponse:
+	past_paper = request.app.state.past_paper
+	if not past_paper:
 		raise HTTPException(status_code=500, detail="Past paper flow unavailable. Index the data first.")
-	response = enhanced_past_paper.handle_past_paper_request("next", session_id=req.sessionId)
+	response = await asyncio.to_thread(past_paper.handle_past_paper_request, "next", session_id=req.sessionId)
 	return {"response": response}
 
 
 @app.post("/api/pastpaper/clarify")
-def clarify_past_paper(req: PastPaperClarifyRequest):
-	if not enhanced_past_paper:
+async def clarify_past_paper(req: PastPaperClarifyRequest, request: Request) -> PastPaperResponse:
+	past_paper = request.app.state.past_paper
+	if not past_paper:
 		raise HTTPException(status_code=500, detail="Past paper flow unavailable. Index the data first.")
 	message = f"clarify question {req.questionNumber}"
-	response = enhanced_past_paper.handle_past_paper_request(message, session_id=req.sessionId)
+	response = await asyncio.to_thread(past_paper.handle_past_paper_request, message, session_id=req.sessionId)
 	return {"response": response}
 
 
 @app.post("/api/pastpaper/answer")
-def answer_past_paper(req: PastPaperAnswerRequest):
-	if not enhanced_past_paper:
+async def answer_past_paper(req: PastPaperAnswerRequest, request: Request) -> PastPaperResponse:
+	past_paper = request.app.state.past_paper
+	if not past_paper:
 		raise HTTPException(status_code=500, detail="Past paper flow unavailable. Index the data first.")
 	message = f"my answer for question {req.questionNumber} is {req.answer}"
-	response = enhanced_past_paper.handle_past_paper_request(message, session_id=req.sessionId)
+	response = await asyncio.to_thread(past_paper.handle_past_paper_request, message, session_id=req.sessionId)
 	return {"response": response}
 
 
+class QAResponse(BaseModel):
+	answer: str
+
+
+class QuizResponse(BaseModel):
+	quiz: str
+
+
+# Appended to a streamed answer when generation fails after the 200 has been sent,
+# so clients can tell an interrupted answer from a complete one
+STREAM_ERROR_MARKER = "\n\n[ERROR] The answer was interrupted. Please try again."
+
+
+async def answer_cached(chain, question: str, cache_kind: str) -> str:
+	"""Returns the cached answer, or runs the chain and caches its output."""
+	cached = await get_cached(cache_kind, question)
+	if cached:
+		return cached
+	answer = await chain.ainvoke({"question": question})
+	await set_cached(cache_kind, question, answer)
+	return answer
+
+
+async def stream_chain(chain, question: str, cache_kind: str):
+	"""Yields the chain output as it is generated and caches the full text at the end."""
+	parts = []
+	try:
+		async for chunk in chain.astream({"question": question}):
+			parts.append(chunk)
+			yield chunk
+	except Exception as e:
+		# Headers are already sent, so the error can only be reported in-band
+		print(f"Streaming {cache_kind} answer failed: {e}")
+		yield STREAM_ERROR_MARKER
+		return
+	await set_cached(cache_kind, question, "".join(parts))
+
+
+async def stream_cached(chain, question: str, cache_kind: str):
+	cached = await get_cached(cache_kind, question)
+	if cached:
+		return PlainTextResponse(cached, headers={"X-Cache": "HIT"})
+	return StreamingResponse(stream_chain(chain, question, cache_kind), media_type="text/plain")
+
+
 @app.post("/api/qa")
-def qa(req: QARequest):
-	if not RAG_CHAIN:
+async def qa(req: QARequest, request: Request) -> QAResponse:
+	rag_chain = request.app.state.rag_chain
+	if not rag_chain:
 		raise HTTPException(status_code=500, detail="QA chain unavailable. Index the data first.")
-	answer = RAG_CHAIN.invoke({"question": req.message})
-	return {"answer": answer}
+	return QAResponse(answer=await answer_cached(rag_chain, req.message, "qa"))
 
 
 @app.post("/api/quiz")
-def quiz(req: QuizRequest):
-	if not QUIZ_CHAIN:
+async def quiz(req: QuizRequest, request: Request) -> QuizResponse:
+	quiz_chain = request.app.state.quiz_chain
+	if not quiz_chain:
+		raise HTTPException(status_code=500, detail="Quiz chain unavailable. Index the data first.")
+	return QuizResponse(quiz=await answer_cached(quiz_chain, req.topic, "quiz"))
+
+
+# Streaming variants: plain text, sent as it is generated
+@app.post("/api/qa/stream")
+async def qa_stream(req: QARequest, request: Request):
+	rag_chain = request.app.state.rag_chain
+	if not rag_chain:
+		raise HTTPException(status_code=500, detail="QA chain unavailable. Index the data first.")
+	return await stream_cached(rag_chain, req.message, "qa")
+
+
+@app.post("/api/quiz/stream")
+async def quiz_stream(req: QuizRequest, request: Request):
+	quiz_chain = request.app.state.quiz_chain
+	if not quiz_chain:
 		raise HTTPException(status_code=500, detail="Quiz chain unavailable. Index the data first.")
-	answer = QUIZ_CHAIN.invoke({"question": req.topic})
-	return {"quiz": answer}
+	return await stream_cached(quiz_chain, req.topic, "quiz")
 
 
 
@@ -134,3 +217,18 @@ def health():
 	return {"status": "ok"}
 
 
+if __name__ == "__main__":
+	import uvicorn
+
+	# Past paper sessions live in process memory, so keep a single worker
+	# unless requests are pinned to workers (e.g. sticky sessions).
+	uvicorn.run(
+		"api:app",
+		host=os.getenv("API_HOST", "0.0.0.0"),
+		port=int(os.getenv("API_PORT", "8000")),
+		workers=int(os.getenv("API_WORKERS", "1")),
+		loop="uvloop",
+		http="httptools",
+		timeout_keep_alive=75,
+		backlog=2048,
+	)
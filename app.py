@@ -5,7 +5,6 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from langchain_chroma import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from chromadb import PersistentClient
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -13,50 +12,83 @@ from langchain_core.runnables import RunnablePassthrough
 from langchain_core.runnables import RunnableBranch
 from langchain_core.runnables import RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.messages import HumanMessage
+from string import Formatter
 from operator import itemgetter 
+from functools import lru_cache
 import re
 from pastpaper_handler import EnhancedPastPaperChain
+from embeddings import BatchedQueryEmbeddings, load_embeddings
+from kb_config import CHROMA_PERSIST_DIR, COLLECTION_NAME, PAST_PAPER_COLLECTION_NAME, COLLECTION_METADATA
 
-CHROMA_PERSIST_DIR = './chroma_db'
-COLLECTION_NAME = "student_notes_kb"
-EMBEDDINGS = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
 LLM_MODEL = "gemini-2.0-flash-exp"
 
-def initialize_retriever():
-    """Loads the persistent Chroma Vector Store and returns a Retriever instance."""
-    print("--- Initializing Retriever from Persistent DB ---")
-    
+# Heavy resources (embedding model, Chroma, Gemini client, chains) are created
+# lazily on first use so importing this module stays cheap.
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """Returns the shared embedding model, loading it on first use."""
+    # Concurrent retrievals share one forward pass for their query embeddings
+    return BatchedQueryEmbeddings(load_embeddings())
+
+
+@lru_cache(maxsize=None)
+def get_llm():
+    """Returns the shared Gemini chat model, creating it on first use."""
+    return ChatGoogleGenerativeAI(
+        model=LLM_MODEL, 
+        temperature=0.0
+    )
+
+
+@lru_cache(maxsize=None)
+def get_vectorstore(collection_name=COLLECTION_NAME):
+    """Opens a persistent Chroma collection once and reuses the handle."""
     try:
         chroma_client = PersistentClient(path=CHROMA_PERSIST_DIR)
     except Exception as e:
         print(f"Error initializing Chroma client: {e}")
         print("Did you forget to run the indexing pipeline?")
         return None
-        
-    vectorstore = Chroma(
+
+    return Chroma(
         client=chroma_client,
-        collection_name=COLLECTION_NAME,
-        embedding_function=EMBEDDINGS
+        collection_name=collection_name,
+        embedding_function=get_embeddings(),
+        collection_metadata=COLLECTION_METADATA,
     )
+
+
+def initialize_retriever():
+    """Loads the persistent Chroma Vector Store and returns a Retriever instance."""
+    print("--- Initializing Retriever from Persistent DB ---")
+    
+    vectorstore = get_vectorstore()
+    if not vectorstore:
+        return None, None
     
     # Use similarity score threshold to avoid low-relevance distractors.
+    # With the cosine space the relevance score is the cosine similarity itself.
+    # 0.58 keeps the old cut: on the former L2 index, 0.4 (1 - L2/sqrt(2)) meant cosine >= ~0.58.
     rag_retriever = vectorstore.as_retriever(
         search_type="similarity_score_threshold",
         search_kwargs={
             "k": 4,
-            "score_threshold": 0.4,
+            "score_threshold": 0.58,
         },
     )
     
     print("Knowledge Base loaded and Retriever is ready.")
     return rag_retriever, vectorstore
 
-RAG_RETRIEVER, VECTORSTORE = initialize_retriever()
 
-llm = ChatGoogleGenerativeAI(
-    model=LLM_MODEL, 
-    temperature=0.0
-)
+@lru_cache(maxsize=None)
+def get_rag_retriever():
+    """Returns the shared RAG retriever, or None if the vector store is unavailable."""
+    return initialize_retriever()[0]
+
 
 router_prompt = ChatPromptTemplate.from_messages([
     ("system", 
@@ -70,35 +102,67 @@ router_prompt = ChatPromptTemplate.from_messages([
     ("human", "{question}")
 ])
 
-router_chain = router_prompt | llm | StrOutputParser()
 
+@lru_cache(maxsize=None)
+def get_router_chain():
+    return router_prompt | get_llm() | StrOutputParser()
 
-def get_past_paper_retriever(unit_code=None, year=None):
-    """Creates a retriever specifically for past papers with filters.
+# Routing is done locally with one compiled alternation; named groups carry the label.
+# Only messages that hint at a quiz/paper without matching a clear pattern go to the
+# router LLM, everything else is plain QA.
+ROUTE_RE = re.compile(
+    r"(?P<PASTPAPER>\b(?:past\s*papers?|previous\s+exams?|\d{4}\s*(?:paper|exam)s?"
+    r"|(?:go|work)\s+through\b.*\b(?:paper|exam)s?|[A-Z]{3}\d{3}\b.*\b20\d{2})\b)"
+    r"|(?P<QUIZ>\b(?:quiz(?:zes)?|mcqs?|multiple[- ]choice|practice\s+(?:questions?|problems?)"
+    r"|test\s+me|ask\s+me\s+(?:some\s+)?questions)\b)",
+    re.I,
+)
+AMBIGUOUS_ROUTE_RE = re.compile(r"\b(?:test|exam|paper|questions?|practice|problems?)\b", re.I)
 
-    Chroma v0.5+ expects a top-level logical operator in the where/filter clause.
-    We therefore always wrap equality conditions in a $and with $eq operators.
-    """
-    if not VECTORSTORE:
-        return None
 
-    conditions = [{"source_type": {"$eq": "PastPaper"}}]
-    if unit_code:
-        conditions.append({"unit_code": {"$eq": unit_code.upper()}})
-    if year:
-        conditions.append({"year": {"$eq": str(year)}})
+@lru_cache(maxsize=4096)
+def _route_with_llm(question: str) -> str:
+    return get_router_chain().invoke({"question": question}).strip().upper()
 
-    chroma_where = {"$and": conditions}
 
-    return VECTORSTORE.as_retriever(
-        search_kwargs={
-            "k": 10,  # Get more chunks for past papers
-            "filter": chroma_where
-        }
-    )
+def route_question(question: str) -> str:
+    """Returns 'PASTPAPER', 'QUIZ' or 'QA' for a user message."""
+    labels = {m.lastgroup for m in ROUTE_RE.finditer(question)}
+    if "PASTPAPER" in labels:
+        return "PASTPAPER"
+    if "QUIZ" in labels:
+        return "QUIZ"
+    if not AMBIGUOUS_ROUTE_RE.search(question):
+        return "QA"
+    # Normalize so trivially different phrasings share a cache entry
+    return _route_with_llm(" ".join(question.lower().split()))
+
+
+@lru_cache(maxsize=None)
+def get_enhanced_past_paper():
+    """Returns the shared past paper handler, or None if the vector store is unavailable."""
+    vectorstore = get_vectorstore(PAST_PAPER_COLLECTION_NAME)
+    return EnhancedPastPaperChain(get_llm(), vectorstore) if vectorstore else None
+
+
+def compile_prompt(template):
+    """Pre-splits a prompt template once so each call is a plain "".join.
+
+    Produces the same single human message as ChatPromptTemplate.from_template,
+    without re-running LangChain's template formatting per request.
+    """
+    # Formatter.parse also turns escaped {{ }} into literal braces
+    pieces = [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
 
+    def format_prompt(inputs):
+        parts = []
+        for literal, field in pieces:
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(inputs[field]))
+        return [HumanMessage(content="".join(parts))]
 
-enhanced_past_paper = EnhancedPastPaperChain(llm, VECTORSTORE) if VECTORSTORE else None
+    return RunnableLambda(format_prompt)
 
 
 def create_rag_chain(llm, retriever):
@@ -124,7 +188,7 @@ def create_rag_chain(llm, retriever):
     QUESTION: {question}
     ANSWER:
     """
-    rag_prompt = ChatPromptTemplate.from_template(rag_prompt_template)
+    rag_prompt = compile_prompt(rag_prompt_template)
 
     # Fallback (no KB match): answer from general knowledge and tag internet source
     fallback_prompt_template = """
@@ -137,13 +201,20 @@ def create_rag_chain(llm, retriever):
     QUESTION: {question}
     ANSWER:
     """
-    fallback_prompt = ChatPromptTemplate.from_template(fallback_prompt_template)
-
-    def format_docs(docs):
-        return "\n\n".join([
-            f"Document Source: {doc.metadata.get('source_type')}_{doc.metadata.get('unit_code')}\nContent: {doc.page_content}"
-            for doc in docs
-        ])
+    fallback_prompt = compile_prompt(fallback_prompt_template)
+
+    def format_docs(docs, _get=dict.get):
+        # Pre-sized list and a locally bound dict.get keep per-doc overhead low
+        parts = [None] * len(docs)
+        for i, doc in enumerate(docs):
+            meta = doc.metadata
+            source = "_".join(filter(None, (_get(meta, 'source_type'), _get(meta, 'unit_code'))))
+            # Docs without source metadata get no label rather than a placeholder the LLM might cite
+            if source:
+                parts[i] = f"Document Source: {source}\nContent: {doc.page_content}"
+            else:
+                parts[i] = f"Content: {doc.page_content}"
+        return "\n\n".join(parts)
 
     # branching chain based on whether any documents were retrieved
     # Step 1: retrieve docs alongside the question
@@ -195,10 +266,10 @@ def create_quiz_chain(llm, retriever):
     ---
     TOPIC REQUESTED BY USER: {question}
     """
-    quiz_prompt = ChatPromptTemplate.from_template(quiz_prompt_template)
+    quiz_prompt = compile_prompt(quiz_prompt_template)
 
     def format_docs(docs):
-        return "\n\n".join([doc.page_content for doc in docs])
+        return "\n\n".join(doc.page_content for doc in docs)
     
     # Prepare retrieval first
     pre = {
@@ -221,7 +292,7 @@ def create_quiz_chain(llm, retriever):
 
     TOPIC REQUESTED BY USER: {question}
     """
-    fallback_quiz_prompt = ChatPromptTemplate.from_template(fallback_quiz_prompt_template)
+    fallback_quiz_prompt = compile_prompt(fallback_quiz_prompt_template)
     fallback_quiz_chain = fallback_quiz_prompt | llm | StrOutputParser()
 
     # Quiz based on retrieved docs (with augmentation allowed by prompt)
@@ -262,23 +333,39 @@ class PastPaperSession:
 past_paper_session = PastPaperSession()
 
 # Master Application Chain 
-if RAG_RETRIEVER:
-    RAG_CHAIN = create_rag_chain(llm, RAG_RETRIEVER)
-    QUIZ_CHAIN = create_quiz_chain(llm, RAG_RETRIEVER)
+# RAG / quiz chains are built once on first use and shared with the API.
+# final_chain (router + branch) is only needed where the route is unknown.
+@lru_cache(maxsize=None)
+def get_rag_chain():
+    retriever = get_rag_retriever()
+    return create_rag_chain(get_llm(), retriever) if retriever else None
+
+
+@lru_cache(maxsize=None)
+def get_quiz_chain():
+    retriever = get_rag_retriever()
+    return create_quiz_chain(get_llm(), retriever) if retriever else None
+
+
+@lru_cache(maxsize=None)
+def get_final_chain():
+    rag_chain, quiz_chain = get_rag_chain(), get_quiz_chain()
+    if not rag_chain:
+        return None
     # Past paper will be handled explicitly via enhanced handler.
-    final_chain = RunnableBranch(
+    return RunnableBranch(
         (
-            lambda x: "QUIZ" in router_chain.invoke({"question": x["question"]}).upper(),
-            QUIZ_CHAIN
+            lambda x: "QUIZ" in route_question(x["question"]),
+            quiz_chain
         ),
-        RAG_CHAIN
+        rag_chain
     )
-else:
-    final_chain = None
 
 def run_assistant():
     """Interactive assistant with past paper support."""
-    if not final_chain:
+    rag_chain, quiz_chain = get_rag_chain(), get_quiz_chain()
+    enhanced_past_paper = get_enhanced_past_paper()
+    if not rag_chain:
         print("\nCannot run assistant. Please fix errors and re-run the indexing pipeline.")
         return
     
@@ -317,13 +404,15 @@ def run_assistant():
                 continue
 
             # Otherwise, use router to decide
-            route = router_chain.invoke({"question": user_input}).upper()
+            route = route_question(user_input)
             if "PASTPAPER" in route and enhanced_past_paper:
                 response = enhanced_past_paper.handle_past_paper_request(user_input, session_id="cli")
                 print(f"\nAssistant: {response}")
                 pastpaper_active = True
             else:
-                response = final_chain.invoke({"question": user_input})
+                # The route is already known, so call the target chain directly
+                chain = quiz_chain if "QUIZ" in route else rag_chain
+                response = chain.invoke({"question": user_input})
                 print(f"\nAssistant: {response}")
         
         except Exception as e:
@@ -332,6 +421,8 @@ def run_assistant():
 
 def run_demo():
     """Run demo queries to test all functionality."""
+    final_chain = get_final_chain()
+    enhanced_past_paper = get_enhanced_past_paper()
     if not final_chain:
         print("\nCannot run assistant. Please fix errors and re-run the indexing pipeline.")
         return
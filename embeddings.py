@@ -0,0 +1,190 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Directory holding the ONNX export of MiniLM (plus its tokenizer files).
+# Create it once with:
+#   optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 --task feature-extraction ./mini_onnx
+# then quantize the weights to INT8 with either
+#   optimum-cli onnxruntime quantize --avx512_vnni --onnx_model ./mini_onnx -o ./mini_onnx
+#   python embeddings.py quantize
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "./mini_onnx")
+ONNX_MODEL_FILES = ("model_quantized.onnx", "model.onnx")
+
+
+def find_onnx_model(model_dir: str = ONNX_MODEL_DIR):
+    """Returns the path of the exported ONNX model, preferring the INT8 quantized one."""
+    for file_name in ONNX_MODEL_FILES:
+        path = os.path.join(model_dir, file_name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def quantize_onnx_model(model_dir: str = ONNX_MODEL_DIR) -> str:
+    """Writes an INT8 dynamically quantized copy of model.onnx and returns its path."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = os.path.join(model_dir, "model.onnx")
+    target = os.path.join(model_dir, "model_quantized.onnx")
+    quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+    return target
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """LangChain embeddings adapter running the MiniLM ONNX export on ONNX Runtime."""
+
+    def __init__(self, model_dir: str = ONNX_MODEL_DIR, batch_size: int = 64, max_length: int = 256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        model_path = find_onnx_model(model_dir)
+        if not model_path:
+            raise FileNotFoundError(f"No ONNX model found in {model_dir}")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = os.cpu_count() or 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        inputs = {name: value.astype(np.int64) for name, value in encoded.items() if name in self.input_names}
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling over real tokens, then L2-normalize (matches sentence-transformers)
+        mask = encoded["attention_mask"][..., None].astype(np.float32)
+        summed = (token_embeddings * mask).sum(axis=1)
+        pooled = summed / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.sqrt((pooled * pooled).sum(-1, keepdims=True))
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for i in range(0, len(texts), self.batch_size):
+            vectors.extend(self._encode(texts[i:i + self.batch_size]).tolist())
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+class BatchedQueryEmbeddings(Embeddings):
+    """Coalesces concurrent embed_query calls into a single batched forward pass.
+
+    A query that arrives while nothing else is being embedded is encoded right
+    away. Queries that overlap with it are queued, and a background thread
+    (started on first use) drains up to ``max_batch_size`` of them, waiting at
+    most ``max_wait_ms`` for stragglers, before encoding them together.
+    Retrieval runs the sync embed_query on executor threads under FastAPI, so
+    concurrent requests end up sharing one batch.
+    """
+
+    def __init__(self, inner: Embeddings, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.inner = inner
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Queries being embedded directly, queued, or in a worker batch
+        self._in_flight = 0
+        self._worker = None
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.inner.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                self._finish(len(batch))
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self._finish(len(batch))
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def _finish(self, count: int):
+        with self._lock:
+            self._in_flight -= count
+
+    def _submit(self, text: str) -> Optional[Future]:
+        """Queues the query and returns its Future, or None if the caller should embed it directly."""
+        with self._lock:
+            self._in_flight += 1
+            if self._in_flight == 1:
+                return None
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="query-embedder", daemon=True)
+                self._worker.start()
+            future = Future()
+            self._queue.put((text, future))
+            return future
+
+    def _embed_now(self, text: str) -> List[float]:
+        try:
+            return self.inner.embed_documents([text])[0]
+        finally:
+            self._finish(1)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        future = self._submit(text)
+        if future is None:
+            return self._embed_now(text)
+        return future.result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        future = self._submit(text)
+        if future is None:
+            return await asyncio.get_running_loop().run_in_executor(None, self._embed_now, text)
+        return await asyncio.wrap_future(future)
+
+
+def load_embeddings() -> Embeddings:
+    """Returns the ONNX Runtime embeddings when an export exists, else the PyTorch model."""
+    if find_onnx_model():
+        print(f"Using ONNX Runtime embeddings from {ONNX_MODEL_DIR}")
+        return OnnxMiniLMEmbeddings()
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "quantize":
+        print(f"Quantized model written to {quantize_onnx_model()}")
+    else:
+        print("Usage: python embeddings.py quantize")
@@ -3,21 +3,36 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader
+from langchain_community.document_loaders import PyMuPDFLoader, Docx2txtLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from chromadb import PersistentClient
+from sentence_transformers import SentenceTransformer
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+import torch
+import hashlib
+import re
+from response_cache import bump_cache_version
+from embeddings import OnnxMiniLMEmbeddings, find_onnx_model
+from kb_config import CHROMA_PERSIST_DIR, COLLECTION_NAME, PAST_PAPER_COLLECTION_NAME, COLLECTION_METADATA
+import math
 
 DATA_DIR = './data'
-CHROMA_PERSIST_DIR = './chroma_db'
-COLLECTION_NAME = "student_notes_kb"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Micro-batch size for the embedding forward passes (64-256 works well)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+# Maximum rows per collection.add call
+UPSERT_BATCH_SIZE = 5000
+# Worker processes used for parsing and chunking (CPU-bound)
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", str(os.cpu_count() or 1)))
 
 def get_document_loader(path: str):
     """Returns the correct LangChain loader based on file extension."""
     file_extension = os.path.splitext(path)[1].lower()
     if file_extension == ".pdf":
-        return PyPDFLoader(path)
+        # MuPDF (C backend) parses far faster than the pure-Python pypdf
+        return PyMuPDFLoader(path)
     elif file_extension == ".docx":
         return Docx2txtLoader(path)
     return None
@@ -50,36 +65,97 @@ def extract_metadata_from_filename(file_path: str) -> dict:
         print(f"Error parsing metadata for {file_path}: {e}")
         return {"error": str(e)}
 
+def load_one(file_path: str) -> List[Document]:
+    """Loads a single file and injects its filename metadata into every page.
+
+    Kept at module level so it can be dispatched to worker processes.
+    """
+    file_name = os.path.basename(file_path)
+
+    # 1. Get the correct loader for the file type
+    loader = get_document_loader(file_path)
+    if not loader:
+        print(f"Skipping unsupported file type: {file_name}")
+        return []
+
+    # 2. Extract metadata from the filename
+    metadata = extract_metadata_from_filename(file_path)
+    if metadata.get("error"):
+        print(f"Skipping file due to metadata error: {metadata.get('error')}")
+        return []
+
+    # 3. Load the document and inject metadata in one step
+    try:
+        docs = loader.load()
+        for doc in docs:
+            doc.metadata.update(metadata)
+        return docs
+    except Exception as e:
+        print(f"Error loading file {file_path}: {e}")
+        return []
+
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embeds chunks in micro-batches, using the INT8 ONNX model when one has been exported."""
+    if find_onnx_model():
+        vectors = OnnxMiniLMEmbeddings(batch_size=EMBED_BATCH_SIZE).embed_documents(texts)
+        print(f"Embedded {len(texts)} chunks with ONNX Runtime (batch size {EMBED_BATCH_SIZE}).")
+        return vectors
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=device)
+    vectors = model.encode(
+        texts,
+        batch_size=EMBED_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=True,
+    )
+    print(f"Embedded {len(texts)} chunks on {device} (batch size {EMBED_BATCH_SIZE}).")
+    return vectors.tolist()
+
+def make_chunk_ids(splits: List[Document]) -> List[str]:
+    """Builds stable chunk ids ("<unique_code>_<n>") so re-indexing is idempotent."""
+    counters = {}
+    ids = []
+    for doc in splits:
+        code = doc.metadata["unique_code"]
+        counters[code] = counters.get(code, -1) + 1
+        ids.append(f"{code}_{counters[code]}")
+    return ids
+
+# Ids written by make_chunk_ids; anything else (e.g. random uuids) comes from an older index
+CHUNK_ID_RE = re.compile(r"^[^_]+_\d+$")
+
+def content_hash(text: str) -> str:
+    """Hash stored with each chunk so edited chunks are re-embedded under the same id."""
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+def is_legacy_collection(collection) -> bool:
+    """True for collections built before stable chunk ids and the cosine index.
+
+    Their chunks can't be matched to the current ones, so they are rebuilt from scratch.
+    """
+    hnsw = (collection.configuration or {}).get("hnsw") or {}
+    if hnsw.get("space", "l2") != COLLECTION_METADATA["hnsw:space"]:
+        return True
+    return any(not CHUNK_ID_RE.match(chunk_id) for chunk_id in collection.get(include=[])["ids"])
+
 def build_knowledge_base():
     """Executes the full RAG indexing pipeline."""
     print("--- 1. Starting Document Loading and Metadata Injection ---")
     
+    # Collect the files first so parsing can be fanned out across processes
+    # (sorted, so chunk ids come out the same on every run)
+    file_paths = sorted(
+        os.path.join(root, file_name)
+        for root, _, files in os.walk(DATA_DIR)
+        for file_name in files
+    )
+
     all_docs = []
-    # Walk through the data directory recursively
-    for root, _, files in os.walk(DATA_DIR):
-        for file_name in files:
-            file_path = os.path.join(root, file_name)
-            
-            # 1. Get the correct loader for the file type
-            loader = get_document_loader(file_path)
-            if not loader:
-                print(f"Skipping unsupported file type: {file_name}")
-                continue
-
-            # 2. Extract metadata from the filename
-            metadata = extract_metadata_from_filename(file_path)
-            if metadata.get("error"):
-                print(f"Skipping file due to metadata error: {metadata.get('error')}")
-                continue
-
-            # 3. Load the document and inject metadata in one step
-            try:
-                docs = loader.load()
-                for doc in docs:
-                    doc.metadata.update(metadata)
-                all_docs.extend(docs)
-            except Exception as e:
-                print(f"Error loading file {file_path}: {e}")
+    with ProcessPoolExecutor(max_workers=INDEX_WORKERS) as executor:
+        for docs in executor.map(load_one, file_paths, chunksize=4):
+            all_docs.extend(docs)
 
     if not all_docs:
         print("No documents were loaded. Please check the data directory and file names.")
@@ -93,24 +169,90 @@ def build_knowledge_base():
         chunk_overlap=150,
         separators=["\n\n", "\n", ". ", " ", ""] 
     )
-    all_splits = text_splitter.split_documents(all_docs)
+    # Split in shards, one per worker, keeping the original document order
+    shard_size = math.ceil(len(all_docs) / INDEX_WORKERS)
+    shards = [all_docs[i:i + shard_size] for i in range(0, len(all_docs), shard_size)]
+    all_splits = []
+    with ProcessPoolExecutor(max_workers=INDEX_WORKERS) as executor:
+        for splits in executor.map(text_splitter.split_documents, shards):
+            all_splits.extend(splits)
     print(f"Split documents into {len(all_splits)} total chunks.")
     
     print("\n--- 3. Embedding and Indexing with Chroma DB (Local Embeddings) ---")
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    
     chroma_client = PersistentClient(path=CHROMA_PERSIST_DIR)
+    collections = {}
+    for name in (COLLECTION_NAME, PAST_PAPER_COLLECTION_NAME):
+        collection = chroma_client.get_or_create_collection(name, metadata=COLLECTION_METADATA)
+        if is_legacy_collection(collection):
+            print(f"Rebuilding '{name}': it predates stable chunk ids or the cosine index.")
+            chroma_client.delete_collection(name)
+            collection = chroma_client.create_collection(name, metadata=COLLECTION_METADATA)
+        collections[name] = collection
+    # Migration: past papers indexed before the collections were split still sit in the
+    # notes collection. Drop them there; they are re-added to the papers collection below.
+    notes = collections[COLLECTION_NAME]
+    misplaced = notes.get(where={"source_type": "PastPaper"}, include=[])["ids"]
+    if misplaced:
+        notes.delete(ids=misplaced)
+        print(f"Removed {len(misplaced)} past paper chunks from '{COLLECTION_NAME}'.")
+
+    # Content hash of every stored chunk, by id
+    stored = {}
+    for name, collection in collections.items():
+        existing = collection.get(include=["metadatas"])
+        stored[name] = {
+            chunk_id: (meta or {}).get("content_hash")
+            for chunk_id, meta in zip(existing["ids"], existing["metadatas"])
+        }
+
+    # Partition chunks so past paper lookups never have to filter the notes.
+    # Chunks stored under the same id with the same content are not embedded again.
+    pending = []
+    wanted = {name: set() for name in collections}
+    for chunk_id, doc in zip(make_chunk_ids(all_splits), all_splits):
+        is_paper = doc.metadata.get("source_type") == "PastPaper"
+        name = PAST_PAPER_COLLECTION_NAME if is_paper else COLLECTION_NAME
+        doc.metadata["content_hash"] = content_hash(doc.page_content)
+        wanted[name].add(chunk_id)
+        if stored[name].get(chunk_id) != doc.metadata["content_hash"]:
+            pending.append((name, chunk_id, doc))
+
+    batch_size = min(UPSERT_BATCH_SIZE, chroma_client.get_max_batch_size())
+
+    # Drop chunks of deleted files, and trailing chunks of files that got shorter
+    removed = 0
+    for name, collection in collections.items():
+        stale = [chunk_id for chunk_id in stored[name] if chunk_id not in wanted[name]]
+        for i in range(0, len(stale), batch_size):
+            collection.delete(ids=stale[i:i + batch_size])
+        removed += len(stale)
+    print(f"{len(all_splits) - len(pending)} chunks unchanged, {len(pending)} new or changed, {removed} removed.")
+
+    if pending:
+        # Sort chunks by length so each micro-batch pads to a similar size
+        pending.sort(key=lambda item: len(item[2].page_content))
+        vectors = embed_texts([doc.page_content for _, _, doc in pending])
+
+        for name, collection in collections.items():
+            rows = [(chunk_id, doc, vector) for (target, chunk_id, doc), vector in zip(pending, vectors) if target == name]
+            # Bounded upserts keep memory flat on large corpora; changed chunks overwrite their old row
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                collection.upsert(
+                    ids=[chunk_id for chunk_id, _, _ in batch],
+                    embeddings=[vector for _, _, vector in batch],
+                    metadatas=[doc.metadata for _, doc, _ in batch],
+                    documents=[doc.page_content for _, doc, _ in batch],
+                )
+            print(f"Indexed {len(rows)} chunks into '{name}'.")
+
+    if pending or removed:
+        # Answers cached against the previous knowledge base are now stale
+        bump_cache_version()
 
-    vectorstore = Chroma.from_documents(
-        documents=all_splits,
-        embedding=embeddings,
-        collection_name=COLLECTION_NAME,
-        client=chroma_client
-    )
-    
     print(f"Knowledge Base built and stored persistently in: {CHROMA_PERSIST_DIR}")
     print("\n INDEXING COMPLETE. Ready for the LLM Application Chains.")
-    return vectorstore
+    return collections
 
 if __name__ == "__main__":
     if not os.path.exists(DATA_DIR):
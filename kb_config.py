@@ -0,0 +1,16 @@
+# Chroma settings shared by the indexing pipeline and the app. Collection
+# metadata is only applied when a collection is first created, so both sides
+# must import it from here rather than keep their own copy.
+CHROMA_PERSIST_DIR = './chroma_db'
+COLLECTION_NAME = "student_notes_kb"
+# Past papers live in their own, much smaller collection
+PAST_PAPER_COLLECTION_NAME = "past_papers_kb"
+
+# HNSW index tuning. hnsw:num_threads is deliberately left out: it would be
+# persisted with the CPU count of whichever machine created the collection.
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 200,
+    "hnsw:search_ef": 64,
+}
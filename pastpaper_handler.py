@@ -1,114 +1,241 @@
 import re
-from typing import Dict, List, Optional, Tuple, Any
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Any, Union
 from dataclasses import dataclass, field
 
-@dataclass
+# Patterns are compiled once at import instead of on every chat message
+# Question markers: "Question 1:", "Q1:", "1.", "1)", "(1)" at the start of a line
+_RE_MARKER = re.compile(r'(?m)^\s*(?:Q(?:uestion)?\s*)?(?:\((\d+)\)|(\d+)[\.:)])\s+')
+# A paragraph runs from its first non-space character up to the next blank line
+_RE_PARA = re.compile(r'(?s)\S.*?(?=\n\n+|\Z)')
+
+# One pass over the message finds every intent keyword; the group name says which flag it sets
+_RE_INTENT = re.compile(
+    r'\b(?P<next>next|continue|more|yes|proceed)\b'
+    r'|\b(?P<clar>clarify|explain|help|confused|understand)\b'
+    r'|\b(?P<ans>answer|my answer|i think|solution)\b'
+    r'|\b(?P<stop>stop|quit|exit|done|finish)\b',
+    re.I,
+)
+_INTENT_FLAGS = {
+    "next": "wants_next",
+    "clar": "wants_clarification",
+    "ans": "has_answer",
+    "stop": "wants_stop",
+}
+_RE_QNUM = re.compile(r'question\s*(\d+)', re.I)
+_RE_ANSWER_TEXT = re.compile(r"(?:answer is|my answer|i think it\'s|solution:)\s*(.+)", re.I)
+
+_RE_NEW_PAPER = re.compile(
+    r'(?:start|begin|go through|work through|practice).*(?:past paper|exam|test)'
+    r'|[A-Z]{3}\d{3}.*\d{4}'  # Unit code patterns
+    r'|\d{4}.*(?:past paper|exam)',  # Year patterns
+    re.I,
+)
+_RE_UNIT = re.compile(r'\b([A-Z]{3}\d{3})\b', re.I)
+_RE_YEAR = re.compile(r'\b(20[0-3]\d)\b')
+
+# Questions shown per "next"
+BATCH_SIZE = 5
+# Chunks fetched per past paper lookup, and how many (unit, year) search filters to keep around
+RETRIEVAL_K = 20
+FILTER_CACHE_SIZE = 64
+# Papers whose extracted questions are kept, keyed by a hash of their retrieved text
+EXTRACT_CACHE_SIZE = 32
+
+# Shared by all chains for the relaxed (year-only) search that runs alongside the
+# strict one; Chroma is thread-safe and idle pool threads are only spawned on demand
+_RETRIEVAL_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="past-paper-retrieval")
+
+_SEP = "-" * 50
+_BLOCK_SEP = "\n" + _SEP + "\n"
+
+# Prompts for the past paper LLM calls; the chains built from them are cached per EnhancedPastPaperChain
+_CLARIFY_TMPL = """
+			You are a patient tutor. Provide a clear, step-by-step explanation and a full worked solution for the following past paper question using your subject knowledge.
+			- Explain key concept(s) succinctly
+			- Break down the approach and show the solution
+			- Highlight common pitfalls or misconceptions
+			- Be precise and exam-ready
+
+			QUESTION:
+			{question}
+
+			EXPLANATION AND FULL SOLUTION:
+			"""
+
+_EVAL_TMPL = """
+			You are grading a student's short answer using your subject knowledge. Be fair, constructive, and concise.
+            Provide:
+            1) A brief verdict (Correct, Partially correct, Incorrect)
+            2) Key points they got right or missed
+            3) A short model answer (2-4 sentences)
+            4) One suggestion for improvement
+
+            QUESTION:
+            {question}
+
+            STUDENT ANSWER:
+            {answer}
+
+            FEEDBACK:
+            """
+
+_MODEL_TMPL = """
+			You are an exam tutor. Provide a concise, correct, exam-ready model answer using your subject knowledge.
+			- Keep it focused: 3-6 bullet points or 4-8 sentences.
+			- If multiple valid approaches exist, pick one and note alternatives briefly.
+			- Be precise and avoid hedging.
+			
+			QUESTION:
+			{question}
+			
+			MODEL ANSWER:
+			"""
+
+
+def build_chroma_filter(conditions: List[Dict]) -> Optional[Dict]:
+    """Combines equality conditions into a Chroma where clause.
+
+    Chroma v0.5+ only accepts a single field or a top-level logical operator,
+    so several conditions are wrapped in $and and none yields no filter.
+    """
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+@dataclass(slots=True)
 class PastPaperSession:
-    """Manages the state of a past paper walkthrough session."""
+    """Manages the state of a past paper walkthrough session.
+
+    Answers are stored by position (question 1 at index 0), sized to the paper in start_paper.
+    """
     unit_code: Optional[str] = None
     year: Optional[str] = None
     current_batch: int = 0
-    questions: List[str] = field(default_factory=list)
-    user_answers: Dict[int, str] = field(default_factory=dict)
-    model_answers: Dict[int, str] = field(default_factory=dict)
+    questions: List[Tuple[int, str]] = field(default_factory=list)
+    user_answers: List[Optional[str]] = field(default_factory=list)
+    model_answers: List[Optional[str]] = field(default_factory=list)
     is_active: bool = False
     total_questions: int = 0
+    # (start, end) question indices of each batch, computed once in start_paper
+    _batch_slices: List[Tuple[int, int]] = field(default_factory=list, repr=False)
     
     def reset(self):
-        """Reset the session to initial state."""
-        self.__init__()
+        """Reset the session to initial state, reusing the existing containers."""
+        self.unit_code = None
+        self.year = None
+        self.current_batch = 0
+        self.total_questions = 0
+        self.is_active = False
+        self.questions.clear()
+        self.user_answers.clear()
+        self.model_answers.clear()
+        self._batch_slices.clear()
     
-    def start_paper(self, unit_code: str, year: str, questions: List[str]):
+    def start_paper(self, unit_code: str, year: str, questions: List[Tuple[int, str]]):
         """Initialize a new past paper session."""
         self.unit_code = unit_code
         self.year = year
-        self.questions = questions
+        # Copy into the session's own list: the extracted questions may be shared through the cache
+        self.questions[:] = questions
         self.total_questions = len(questions)
         self.current_batch = 0
         self.is_active = True
-        self.user_answers = {}
-        self.model_answers = {}
+        self.user_answers = [None] * self.total_questions
+        self.model_answers = [None] * self.total_questions
+        total = self.total_questions
+        self._batch_slices = [(i, min(i + BATCH_SIZE, total)) for i in range(0, total, BATCH_SIZE)]
     
-    def get_next_batch(self, batch_size: int = 5) -> Tuple[List[str], bool]:
+    def get_next_batch(self) -> Tuple[List[Tuple[int, str]], bool]:
         """Get the next batch of questions."""
-        start_idx = self.current_batch * batch_size
-        end_idx = min(start_idx + batch_size, self.total_questions)
-        
-        batch = self.questions[start_idx:end_idx]
-        has_more = end_idx < self.total_questions
-        
+        if self.current_batch >= len(self._batch_slices):
+            return [], False
+
+        start_idx, end_idx = self._batch_slices[self.current_batch]
         self.current_batch += 1
-        
-        return batch, has_more
+
+        return self.questions[start_idx:end_idx], self.current_batch < len(self._batch_slices)
+
+    def get_batch_start(self) -> int:
+        """Get the number of the first question in the batch shown last."""
+        return self._batch_slices[self.current_batch - 1][0] + 1 if self.current_batch else 1
     
     def get_current_progress(self) -> str:
         """Get a string representing current progress."""
-        questions_shown = min(self.current_batch * 5, self.total_questions)
+        questions_shown = self._batch_slices[self.current_batch - 1][1] if self.current_batch else 0
         return f"Questions {questions_shown}/{self.total_questions}"
     
     def save_answer(self, question_num: int, answer: str):
         """Save a user's answer for a question."""
-        self.user_answers[question_num] = answer
+        self.user_answers[question_num - 1] = answer
 
 
 class PastPaperProcessor:
     """Processes and manages past paper content."""
     
     @staticmethod
-    def extract_questions(documents: List[Any]) -> List[str]:
-        """Extract individual questions from retrieved documents.
+    def extract_questions(documents: Union[List[Any], str]) -> List[Tuple[int, str]]:
+        """Extract individual questions from retrieved documents as (number, text) pairs.
 
         Robustly segments content into question blocks using common numbering styles
         and tolerating leading indentation/whitespace:
         - "Question 1:", "Q1:", "1.", "1)", "(1)"
         Falls back to paragraph splitting if no markers are found.
+        Accepts the documents or their already joined content.
         """
-        all_content = "\n".join([doc.page_content for doc in documents])
-
-		
-        question_pattern = re.compile(
-            (
-                r"(?ms)"  # multiline + dotall
-                r"^\s*(?:Q(?:uestion)?\s*)?(?:\((\d+)\)|(\d+)[\.:)])\s+"  # marker
-                r"(.*?)"  # question text (lazy)
-                r"(?=^\s*(?:Q(?:uestion)?\s*)?(?:\(\d+\)|\d+[\.:)])\s+|\Z)"  # next marker or end
-            )
-        )
+        if isinstance(documents, str):
+            all_content = documents
+        else:
+            all_content = "\n".join(doc.page_content for doc in documents)
 
-        matches = list(question_pattern.finditer(all_content))
-        questions: List[str] = []
-        if matches:
-            # Sort by numeric question number 
+        # Find the markers once, then slice each question body out from between them
+        marks = [(m.start(), m.end(), int(m.group(1) or m.group(2))) for m in _RE_MARKER.finditer(all_content)]
+        questions: List[Tuple[int, str]] = []
+        if marks:
             extracted = []
-            for m in matches:
-                num_str = m.group(1) or m.group(2)
-                q_text = m.group(3).strip()
+            for i, (_, body_start, q_num) in enumerate(marks):
+                body_end = marks[i + 1][0] if i + 1 < len(marks) else len(all_content)
+                q_text = all_content[body_start:body_end].strip()
                 if q_text and len(q_text) > 3:
-                    extracted.append((int(num_str), q_text))
-            sorted_matches = sorted(extracted, key=lambda x: x[0])
-            for q_num, q_text in sorted_matches:
-                questions.append(f"Question {q_num}: {q_text}")
+                    extracted.append((q_num, q_text))
+            # Papers are normally already in order; only sort by question number when they aren't
+            if any(extracted[i][0] > extracted[i + 1][0] for i in range(len(extracted) - 1)):
+                extracted.sort(key=lambda x: x[0])
+            questions = extracted
 
-        # If no numbered questions found, split by double newlines 
+        # If no numbered questions found, treat each paragraph as a question
         if not questions:
-            sections = [s.strip() for s in re.split(r"\n\n+", all_content) if s.strip()]
-            questions = [f"Question {i + 1}: {section}" for i, section in enumerate(sections) if len(section) > 20]
+            for i, m in enumerate(_RE_PARA.finditer(all_content), 1):
+                section = m.group().strip()
+                if len(section) > 20:
+                    questions.append((i, section))
 
         return questions
     
     @staticmethod
-    def format_batch(questions: List[str], start_num: int = 1, answers: Optional[Dict[int, str]] = None) -> str:
-        """Format a batch of questions for display with clean separation and readability."""
+    def format_batch(questions: List[Tuple[int, str]], start_num: int = 1, answers: Optional[List[Optional[str]]] = None) -> str:
+        """Format a batch of questions for display with clean separation and readability.
+
+        Questions are numbered by their position in the session, which is also
+        the number users refer to when answering or asking for clarification.
+        """
         formatted_blocks: List[str] = []
-        for offset, raw in enumerate(questions):
+        for offset, (_, q_text) in enumerate(questions):
             q_index = start_num + offset
-            cleaned = re.sub(rf"^\s*Question\s+{q_index}:\s*", "", raw).strip()
-            block = f"**Question {q_index}:**\n{cleaned}\n"
-            if answers and q_index in answers:
-                block += f"\n**Answer:**\n{answers[q_index]}\n"
+            block = f"**Question {q_index}:**\n{q_text}\n"
+            if answers and q_index <= len(answers) and answers[q_index - 1] is not None:
+                block += f"\n**Answer:**\n{answers[q_index - 1]}\n"
             formatted_blocks.append(block)
 
-        return ("\n" + ("-" * 50) + "\n").join(formatted_blocks)
+        return _BLOCK_SEP.join(formatted_blocks)
     
     @staticmethod
     def parse_user_intent(user_input: str) -> Dict[str, any]:
@@ -122,38 +249,70 @@ class PastPaperProcessor:
             "answer_text": None
         }
         
-        # Check for continuation
-        if re.search(r'\b(next|continue|more|yes|proceed)\b', user_input.lower()):
-            intent["wants_next"] = True
-        
-        # Check for clarification request
-        if re.search(r'\b(clarify|explain|help|confused|understand)\b', user_input.lower()):
-            intent["wants_clarification"] = True
-            # Try to extract question number
-            num_match = re.search(r'question\s*(\d+)', user_input.lower())
-            if num_match:
-                intent["question_num"] = int(num_match.group(1))
-        
-        # Check for answer attempt
-        if re.search(r'\b(answer|my answer|i think|solution)\b', user_input.lower()):
-            intent["has_answer"] = True
-            # Extract question number and answer
-            num_match = re.search(r'question\s*(\d+)', user_input.lower())
-            if num_match:
-                intent["question_num"] = int(num_match.group(1))
+        # Check for continuation, clarification, answer attempt and stop requests
+        for match in _RE_INTENT.finditer(user_input):
+            intent[_INTENT_FLAGS[match.lastgroup]] = True
+
+        if intent["has_answer"]:
             # The answer text would be everything after certain keywords
-            answer_match = re.search(r'(?:answer is|my answer|i think it\'s|solution:)\s*(.+)', 
-                                    user_input, re.IGNORECASE)
+            answer_match = _RE_ANSWER_TEXT.search(user_input)
             if answer_match:
                 intent["answer_text"] = answer_match.group(1).strip()
-        
-        # Check for stop request
-        if re.search(r'\b(stop|quit|exit|done|finish)\b', user_input.lower()):
-            intent["wants_stop"] = True
-        
+
+        # Both clarifications and answers refer to a question number; look it up once
+        if intent["wants_clarification"] or intent["has_answer"]:
+            num_match = _RE_QNUM.search(user_input)
+            if num_match:
+                intent["question_num"] = int(num_match.group(1))
+
         return intent
 
 
+# Every chat turn is checked for a new paper request; short inputs ("next", "CSC231 2024")
+# repeat a lot, so their results are memoized. Longer inputs are too unique to be worth caching.
+_MAX_CACHED_INPUT_LEN = 256
+# Every new paper pattern needs one of these words or a digit
+_NEW_PAPER_WORDS = ("paper", "exam", "test")
+
+
+def _match_new_paper_request(user_input: str) -> bool:
+    return _RE_NEW_PAPER.search(user_input) is not None
+
+
+def _match_paper_details(user_input: str) -> Tuple[Optional[str], Optional[str]]:
+    # Extract unit code (e.g., CSC231, MAT101)
+    unit_match = _RE_UNIT.search(user_input)
+    unit_code = unit_match.group(1).upper() if unit_match else None
+
+    # Extract year (4-digit number between 2000-2030)
+    year_match = _RE_YEAR.search(user_input)
+    year = year_match.group(1) if year_match else None
+
+    return unit_code, year
+
+
+_cached_new_paper_request = lru_cache(maxsize=1024)(_match_new_paper_request)
+_cached_paper_details = lru_cache(maxsize=1024)(_match_paper_details)
+
+
+def _is_new_paper_request(user_input: str) -> bool:
+    """Check if this is a request for a new past paper."""
+    # Cheap prefilter so replies like "next" or "stop" skip the regexes (and the cache) entirely
+    lowered = user_input.casefold()
+    if not any(word in lowered for word in _NEW_PAPER_WORDS) and not any(c.isdigit() for c in user_input):
+        return False
+    if len(user_input) < _MAX_CACHED_INPUT_LEN:
+        return _cached_new_paper_request(user_input)
+    return _match_new_paper_request(user_input)
+
+
+def _extract_paper_details(user_input: str) -> Tuple[Optional[str], Optional[str]]:
+    """Extract unit code and year from user input."""
+    if len(user_input) < _MAX_CACHED_INPUT_LEN:
+        return _cached_paper_details(user_input)
+    return _match_paper_details(user_input)
+
+
 class EnhancedPastPaperChain:
     """Enhanced chain for handling past paper interactions."""
     
@@ -162,6 +321,63 @@ class EnhancedPastPaperChain:
         self.vectorstore = vectorstore
         self.sessions = {}  
         self.processor = PastPaperProcessor()
+        self._clarify_chain = None
+        self._eval_chain = None
+        self._modelanswer_chain = None
+        # Requests are handled on several worker threads, so both caches below are guarded by locks
+        self._filter_cache: "OrderedDict[Tuple[Optional[str], Optional[str]], Optional[Dict]]" = OrderedDict()
+        self._filter_lock = threading.Lock()
+        # Extracted questions are shared between sessions, so they must not be mutated
+        self._extract_cache: "OrderedDict[str, List[Tuple[int, str]]]" = OrderedDict()
+        self._extract_lock = threading.Lock()
+
+    def _get_search_filter(self, unit_code: Optional[str], year: Optional[str]) -> Optional[Dict]:
+        """Get the Chroma filter for a unit code and year, building it on first use."""
+        key = (unit_code, year)
+        with self._filter_lock:
+            if key in self._filter_cache:
+                self._filter_cache.move_to_end(key)
+                return self._filter_cache[key]
+
+            # The vector store only holds past papers, so filter on unit/year alone
+            conditions = []
+            if unit_code:
+                conditions.append({"unit_code": {"$eq": unit_code}})
+            if year:
+                conditions.append({"year": {"$eq": str(year)}})
+
+            chroma_filter = self._filter_cache[key] = build_chroma_filter(conditions)
+            if len(self._filter_cache) > FILTER_CACHE_SIZE:
+                self._filter_cache.popitem(last=False)
+        return chroma_filter
+
+    def _extract_questions_cached(self, all_content: str) -> List[Tuple[int, str]]:
+        """Extract questions from the joined paper text, reusing the result for a paper seen recently."""
+        key = hashlib.blake2b(all_content.encode(), digest_size=16).hexdigest()
+        with self._extract_lock:
+            questions = self._extract_cache.get(key)
+            if questions is not None:
+                self._extract_cache.move_to_end(key)
+                return questions
+
+        questions = self.processor.extract_questions(all_content)
+        with self._extract_lock:
+            self._extract_cache[key] = questions
+            if len(self._extract_cache) > EXTRACT_CACHE_SIZE:
+                self._extract_cache.popitem(last=False)
+        return questions
+
+    def _build_chains(self):
+        """Builds the clarification, grading and model answer pipelines once."""
+        if self._clarify_chain is not None:
+            return
+        # Lazy import to avoid requiring langchain during smoke tests
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+        parser = StrOutputParser()
+        self._clarify_chain = ChatPromptTemplate.from_template(_CLARIFY_TMPL) | self.llm | parser
+        self._eval_chain = ChatPromptTemplate.from_template(_EVAL_TMPL) | self.llm | parser
+        self._modelanswer_chain = ChatPromptTemplate.from_template(_MODEL_TMPL) | self.llm | parser
     
     def get_or_create_session(self, session_id: str = "default") -> PastPaperSession:
         """Get existing session or create new one."""
@@ -174,7 +390,7 @@ class EnhancedPastPaperChain:
         session = self.get_or_create_session(session_id)
         
         # If starting a new past paper request
-        if not session.is_active or self._is_new_paper_request(user_input):
+        if not session.is_active or _is_new_paper_request(user_input):
             return self._start_new_paper(user_input, session)
         
         # Otherwise, handle ongoing session
@@ -196,46 +412,29 @@ class EnhancedPastPaperChain:
         # Default: assume they want the next batch
         return self._show_next_batch(session)
     
-    def _is_new_paper_request(self, user_input: str) -> bool:
-        """Check if this is a request for a new past paper."""
-        patterns = [
-            r'(start|begin|go through|work through|practice).*(past paper|exam|test)',
-            r'(CSC|MAT|PHY|[A-Z]{3})\d{3}.*\d{4}',  # Unit code patterns
-            r'\d{4}.*(past paper|exam)',  # Year patterns
-        ]
-        
-        for pattern in patterns:
-            if re.search(pattern, user_input, re.IGNORECASE):
-                return True
-        return False
-    
     def _start_new_paper(self, user_input: str, session: PastPaperSession) -> str:
         """Start a new past paper session."""
         # Extract unit code and year
-        unit_code, year = self._extract_paper_details(user_input)
-        
-        base_conditions = [{"source_type": {"$eq": "PastPaper"}}]
+        unit_code, year = _extract_paper_details(user_input)
+        
+        # Prefer the strict unit/year match; if it is empty, fall back to the year alone.
+        # The query is embedded once and both searches run at once from that vector, so a
+        # miss on the unit code costs no extra round trip. The price is a second (filtered,
+        # small-collection) Chroma search on every turn, whose result is discarded on a strict hit.
+        vector = self.vectorstore.embeddings.embed_query(user_input)
+        search = self.vectorstore.similarity_search_by_vector
+        relaxed = None
         if unit_code:
-            base_conditions.append({"unit_code": {"$eq": unit_code}})
-        if year:
-            base_conditions.append({"year": {"$eq": str(year)}})
-
-        strict_filter = {"$and": base_conditions}
-
-        # Try strict filter first; if empty, relax unit_code filter 
-        retriever = self.vectorstore.as_retriever(search_kwargs={"k": 20, "filter": strict_filter})
-        docs = retriever.get_relevant_documents(user_input)
-        if not docs and unit_code:
-            relaxed_conditions = [c for c in base_conditions if "unit_code" not in c]
-            relaxed_filter = {"$and": relaxed_conditions} if relaxed_conditions else {}
-            retriever = self.vectorstore.as_retriever(search_kwargs={"k": 20, "filter": relaxed_filter})
-            docs = retriever.get_relevant_documents(user_input)
+            relaxed = _RETRIEVAL_POOL.submit(search, vector, k=RETRIEVAL_K, filter=self._get_search_filter(None, year))
+        docs = search(vector, k=RETRIEVAL_K, filter=self._get_search_filter(unit_code, year))
+        if relaxed is not None and not docs:
+            docs = relaxed.result()
         
         if not docs:
             return f"I couldn't find a past paper matching your criteria (Unit: {unit_code or 'Any'}, Year: {year or 'Any'}). Please check the unit code and year, or try being more specific."
         
         # Extract questions from documents
-        questions = self.processor.extract_questions(docs)
+        questions = self._extract_questions_cached("\n".join(doc.page_content for doc in docs))
         
         if not questions:
             return "I found the past paper but couldn't extract the questions properly. The document might be in an unexpected format."
@@ -246,24 +445,25 @@ class EnhancedPastPaperChain:
         # Show first batch (questions only; answers on demand)
         batch, has_more = session.get_next_batch()
 
-        response = f"**Starting {session.unit_code} ({session.year}) Past Paper**\n"
-        response += f"Total questions: {session.total_questions}\n"
-        response += "-" * 50 + "\n"
- 
-        response += self.processor.format_batch(batch, 1)
-        response += "\n" + "-" * 50 + "\n"
-        
+        parts: List[str] = [
+            f"**Starting {session.unit_code} ({session.year}) Past Paper**\n",
+            f"Total questions: {session.total_questions}\n",
+            _SEP + "\n",
+            self.processor.format_batch(batch, 1),
+            _BLOCK_SEP,
+        ]
+
         if has_more:
-            response += "\n **What would you like to do?**\n"
-            response += "• Type 'next' or 'continue' to see the next 5 questions\n"
-            response += "• Answer a question (e.g., 'My answer for question 1 is...')\n"
-            response += "• Ask for clarification (e.g., 'Can you explain question 3?')\n"
-            response += "• Type 'stop' to end the session"
+            parts.append("\n **What would you like to do?**\n")
+            parts.append(f"• Type 'next' or 'continue' to see the next {BATCH_SIZE} questions\n")
+            parts.append("• Answer a question (e.g., 'My answer for question 1 is...')\n")
+            parts.append("• Ask for clarification (e.g., 'Can you explain question 3?')\n")
+            parts.append("• Type 'stop' to end the session")
         else:
-            response += "\n **That's all the questions!**\n"
-            response += "Feel free to attempt any question or ask for help to answer a question."
-        
-        return response
+            parts.append("\n **That's all the questions!**\n")
+            parts.append("Feel free to attempt any question or ask for help to answer a question.")
+
+        return "".join(parts)
     
     def _show_next_batch(self, session: PastPaperSession) -> str:
         """Show the next batch of questions."""
@@ -276,20 +476,21 @@ class EnhancedPastPaperChain:
             session.reset()
             return "You've completed all questions in this past paper! Great job! 🎉\nWould you like to review any answers or start another paper?"
         
-        start_num = (session.current_batch - 1) * 5 + 1
+        start_num = session.get_batch_start()
 
-        response = f"**Continuing {session.unit_code} ({session.year}) - {session.get_current_progress()}**\n"
-        response += "-" * 50 + "\n"
+        parts: List[str] = [
+            f"**Continuing {session.unit_code} ({session.year}) - {session.get_current_progress()}**\n",
+            _SEP + "\n",
+            self.processor.format_batch(batch, start_num),
+            _BLOCK_SEP,
+        ]
 
-        response += self.processor.format_batch(batch, start_num)
-        response += "\n" + "-" * 50 + "\n"
-        
         if has_more:
-            response += "\n Ready for more? Type 'next' to continue, or work on these questions first."
+            parts.append("\n Ready for more? Type 'next' to continue, or work on these questions first.")
         else:
-            response += "\n **These are the final questions!**"
-        
-        return response
+            parts.append("\n **These are the final questions!**")
+
+        return "".join(parts)
     
     def _provide_clarification(self, intent: Dict, session: PastPaperSession) -> str:
         """Provide a full clarification and worked solution for a specific question using model knowledge (no retrieval)."""
@@ -300,28 +501,10 @@ class EnhancedPastPaperChain:
         if not q_num or q_num > len(session.questions):
             return "Please specify a valid question number for clarification."
         
-        question = session.questions[q_num - 1]
-		
-        # Lazy import for  smoke tests
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
-        prompt = ChatPromptTemplate.from_template(
-			"""
-			You are a patient tutor. Provide a clear, step-by-step explanation and a full worked solution for the following past paper question using your subject knowledge.
-			- Explain key concept(s) succinctly
-			- Break down the approach and show the solution
-			- Highlight common pitfalls or misconceptions
-			- Be precise and exam-ready
-
-			QUESTION:
-			{question}
-
-			EXPLANATION AND FULL SOLUTION:
-			"""
-		)
+        question = session.questions[q_num - 1][1]
 
-        chain = prompt | self.llm | StrOutputParser()
-        clarification = chain.invoke({"question": question})
+        self._build_chains()
+        clarification = self._clarify_chain.invoke({"question": question})
 
         response = f"**Clarification and Solution for Question {q_num}:**\n\n{clarification}\n\n Would you like to attempt this question now?"
         return response
@@ -336,36 +519,16 @@ class EnhancedPastPaperChain:
         
         if not q_num or not answer:
             return "Please provide both the question number and your answer."
+        if q_num > session.total_questions:
+            return "Please specify a valid question number for your answer."
         
         # Save the answer
         session.save_answer(q_num, answer)
 
-        question_text = session.questions[q_num - 1]
+        question_text = session.questions[q_num - 1][1]
 
-        # Lazy import for during smoke tests
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
-        eval_prompt = ChatPromptTemplate.from_template(
-            """
-			You are grading a student's short answer using your subject knowledge. Be fair, constructive, and concise.
-            Provide:
-            1) A brief verdict (Correct, Partially correct, Incorrect)
-            2) Key points they got right or missed
-            3) A short model answer (2-4 sentences)
-            4) One suggestion for improvement
-
-            QUESTION:
-            {question}
-
-            STUDENT ANSWER:
-            {answer}
-
-            FEEDBACK:
-            """
-        )
-
-        chain = eval_prompt | self.llm | StrOutputParser()
-        feedback = chain.invoke({"question": question_text, "answer": answer})
+        self._build_chains()
+        feedback = self._eval_chain.invoke({"question": question_text, "answer": answer})
 
         response = (
             f"**Your answer for Question {q_num}:**\n{answer}\n\n"
@@ -374,46 +537,31 @@ class EnhancedPastPaperChain:
         )
         return response
     
-    def _extract_paper_details(self, user_input: str) -> Tuple[Optional[str], Optional[str]]:
-        """Extract unit code and year from user input."""
-        # Extract unit code (e.g., CSC231, MAT101)
-        unit_match = re.search(r'\b([A-Z]{3}\d{3})\b', user_input.upper())
-        unit_code = unit_match.group(1) if unit_match else None
-        
-        # Extract year (4-digit number between 2000-2030)
-        year_match = re.search(r'\b(20[0-3]\d)\b', user_input)
-        year = year_match.group(1) if year_match else None
-        
-        return unit_code, year
+    def _generate_answers_for_batch(self, questions: List[Tuple[int, str]], start_index: int, session: PastPaperSession) -> None:
+        """Generate concise model answers for a batch using model knowledge and store them in session.model_answers.
 
-    def _generate_answers_for_batch(self, questions: List[str], start_index: int, session: PastPaperSession) -> None:
-        """Generate concise model answers for a batch using model knowledge and store them in session.model_answers."""
-        # Lazy import to avoid requiring langchain during smoke tests
-        from langchain_core.prompts import ChatPromptTemplate
-        from langchain_core.output_parsers import StrOutputParser
-        prompt = ChatPromptTemplate.from_template(
-			"""
-			You are an exam tutor. Provide a concise, correct, exam-ready model answer using your subject knowledge.
-			- Keep it focused: 3-6 bullet points or 4-8 sentences.
-			- If multiple valid approaches exist, pick one and note alternatives briefly.
-			- Be precise and avoid hedging.
-			
-			QUESTION:
-			{question}
-			
-			MODEL ANSWER:
-			"""
-		)
-        chain = prompt | self.llm | StrOutputParser()
-
-        for offset, q in enumerate(questions):
-            q_index = start_index + offset
-			# Skip if already generated (e.g., user revisits)
-            if q_index in session.model_answers:
-                continue
-            try:
-                answer = chain.invoke({"question": q})
-            except Exception:
-                answer = "(Unable to generate an answer at this time.)"
+        Currently unused: answers are generated on demand by _provide_clarification.
+        """
+        self._build_chains()
+        chain = self._modelanswer_chain
 
-            session.model_answers[q_index] = answer
+        # Skip questions already answered (e.g., user revisits)
+        pending = [
+            (start_index + offset, q)
+            for offset, (_, q) in enumerate(questions)
+            if session.model_answers[start_index + offset - 1] is None
+        ]
+        if not pending:
+            return
+
+        # Ask for all answers concurrently; a failed call only affects its own question
+        answers = chain.batch(
+            [{"question": q} for _, q in pending],
+            config={"max_concurrency": len(pending)},
+            return_exceptions=True,
+        )
+
+        for (q_index, _), answer in zip(pending, answers):
+            if isinstance(answer, Exception):
+                answer = "(Unable to generate an answer at this time.)"
+            session.model_answers[q_index - 1] = answer
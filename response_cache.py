@@ -0,0 +1,77 @@
+import os
+import hashlib
+from typing import Optional
+
+# Redis hot cache for repeated QA / quiz requests. Disabled unless ENABLE_CACHE is set.
+ENABLE_CACHE = os.getenv("ENABLE_CACHE", "false").lower() in ("1", "true", "yes")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "900"))
+# Bumped after every re-index so answers built on the old knowledge base are ignored
+VERSION_KEY = "kb:version"
+
+_client = None
+
+
+def _get_client():
+    """Returns the shared async Redis client, or None when caching is disabled."""
+    global _client
+    if not ENABLE_CACHE:
+        return None
+    if _client is None:
+        import redis.asyncio as aioredis
+        _client = aioredis.from_url(REDIS_URL)
+    return _client
+
+
+def normalize_question(text: str) -> str:
+    """Lower-cases and collapses whitespace so trivially different phrasings share a key."""
+    return " ".join(text.lower().split())
+
+
+def _make_key(kind: str, text: str) -> str:
+    digest = hashlib.blake2b(normalize_question(text).encode(), digest_size=16).hexdigest()
+    return f"{kind}:{digest}"
+
+
+def _decode_version(version) -> str:
+    return version.decode() if version else "0"
+
+
+async def get_cached(kind: str, text: str) -> Optional[str]:
+    """Returns the cached response for (kind, text), if any."""
+    client = _get_client()
+    if not client:
+        return None
+    try:
+        # Entries are stored as "<version>:<response>", so one MGET fetches both
+        version, cached = await client.mget(VERSION_KEY, _make_key(kind, text))
+    except Exception as e:
+        print(f"Cache lookup failed: {e}")
+        return None
+    if not cached:
+        return None
+    entry_version, _, value = cached.decode().partition(":")
+    return value if entry_version == _decode_version(version) else None
+
+
+async def set_cached(kind: str, text: str, value: str) -> None:
+    """Stores a response for (kind, text) with the configured TTL."""
+    client = _get_client()
+    if not client:
+        return
+    try:
+        version = _decode_version(await client.get(VERSION_KEY))
+        await client.setex(_make_key(kind, text), CACHE_TTL, f"{version}:{value}")
+    except Exception as e:
+        print(f"Cache store failed: {e}")
+
+
+def bump_cache_version() -> None:
+    """Invalidates every cached response; called after the knowledge base is rebuilt."""
+    if not ENABLE_CACHE:
+        return
+    try:
+        import redis
+        redis.Redis.from_url(REDIS_URL).incr(VERSION_KEY)
+    except Exception as e:
+        print(f"Cache invalidation failed: {e}")
@@ -1,4 +1,4 @@
-from pastpaper_handler import PastPaperProcessor, PastPaperSession
+from pastpaper_handler import EnhancedPastPaperChain, PastPaperProcessor, PastPaperSession
 
 class SimpleDoc:
     def __init__(self, content: str):
@@ -79,8 +79,9 @@ C. Passwords
 D. URLs
 """
 
-def run_pastpaper_batch_smoke():
-    docs = [ SimpleDoc(SAMPLE_CONTENT) ]
+SAMPLE_DOCS = [SimpleDoc(SAMPLE_CONTENT)]
+
+def run_pastpaper_batch_smoke(docs=SAMPLE_DOCS):
     questions = PastPaperProcessor.extract_questions(docs)
     assert len(questions) == 12, f"Expected 12 questions extracted, got {len(questions)}"
 
@@ -105,6 +106,51 @@ def run_pastpaper_batch_smoke():
     print("OK: Batching returns 5 + 5 + 2 with correct has_more flags.")
 
 
+def run_session_answers_smoke(docs=SAMPLE_DOCS):
+    questions = PastPaperProcessor.extract_questions(docs)
+    session = PastPaperSession()
+    session.start_paper("CSC999", "2024", questions)
+
+    # Answers are stored by position, one slot per question
+    assert session.user_answers == [None] * 12, f"Expected 12 empty answer slots, got {session.user_answers}"
+    assert session.model_answers == [None] * 12, f"Expected 12 empty model answer slots, got {session.model_answers}"
+    session.save_answer(3, "B")
+    assert session.user_answers[2] == "B", "Answer to question 3 should be stored at index 2"
+
+    # Out-of-range question numbers are rejected before anything is stored (no LLM needed)
+    chain = EnhancedPastPaperChain(None, None)
+    reply = chain._process_answer({"question_num": 13, "answer_text": "B"}, session)
+    assert reply == "Please specify a valid question number for your answer.", f"Unexpected reply: {reply}"
+    assert len(session.user_answers) == 12 and session.user_answers.count("B") == 1
+
+    print("OK: Answers are stored by position and out-of-range questions are rejected.")
+
+
+def run_session_reset_smoke(content=SAMPLE_CONTENT):
+    chain = EnhancedPastPaperChain(None, None)
+    questions = chain._extract_questions_cached(content)
+    snapshot = list(questions)
+    assert len(questions) == 12, f"Expected 12 questions extracted, got {len(questions)}"
+
+    # Sessions copy the cached questions, so mutating or resetting one must not touch the cache
+    session = PastPaperSession()
+    session.start_paper("CSC999", "2024", questions)
+    session.questions.pop()
+    session.reset()
+    assert chain._extract_questions_cached(content) == snapshot, "Cached extraction changed after session reset"
+    assert session.questions == [] and session.user_answers == [] and not session.is_active
+
+    # A reset session can start another paper from scratch
+    session.start_paper("CSC998", "2023", chain._extract_questions_cached(content))
+    assert session.unit_code == "CSC998" and session.total_questions == 12
+    assert session.user_answers == [None] * 12
+    batch, more = session.get_next_batch()
+    assert len(batch) == 5 and more is True, f"Expected a first batch of 5 after restart, got {len(batch)}"
+    assert session.get_current_progress() == "Questions 5/12"
+
+    print("OK: Reset sessions restart cleanly and leave cached extractions intact.")
+
+
 # New smoke test: enumerated style with "1)" numbering and subparts
 SAMPLE_ENUMERATED_CONTENT = """
 1) Using the keywords "good, bad, input, output" clearly distinguish between accuracy and security.
@@ -155,17 +201,20 @@ SAMPLE_ENUMERATED_CONTENT = """
 18) What is a Stateful Packet Inspection Firewall?
 """
 
+SAMPLE_ENUM_DOCS = [SimpleDoc(SAMPLE_ENUMERATED_CONTENT)]
+
 
-def run_enumerated_style_smoke():
-    docs = [SimpleDoc(SAMPLE_ENUMERATED_CONTENT)]
+def run_enumerated_style_smoke(docs=SAMPLE_ENUM_DOCS):
     questions = PastPaperProcessor.extract_questions(docs)
     assert len(questions) == 18, f"Expected 18 questions extracted for enumerated style, got {len(questions)}\n\nFirst: {questions[0] if questions else 'NONE'}"
-    # Spot-check a few questions contain expected fragments
-    assert "Question 1:" in questions[0]
-    assert "Question 9:" in questions[8]
-    assert "Question 18:" in questions[-1]
+    # Spot-check a few questions carry the expected numbers and text
+    assert questions[0][0] == 1 and "accuracy and security" in questions[0][1]
+    assert questions[8][0] == 9 and "CBC" in questions[8][1]
+    assert questions[-1][0] == 18 and "Stateful Packet Inspection" in questions[-1][1]
 
 if __name__ == "__main__":
-    run_pastpaper_batch_smoke()
-    run_enumerated_style_smoke()
+    run_pastpaper_batch_smoke(SAMPLE_DOCS)
+    run_session_answers_smoke(SAMPLE_DOCS)
+    run_session_reset_smoke(SAMPLE_CONTENT)
+    run_enumerated_style_smoke(SAMPLE_ENUM_DOCS)
     print("All smoke tests passed.")
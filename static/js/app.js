@@ -58,6 +58,12 @@ function appendMessage(role, text) {
     msg.innerHTML = `<div class="bubble ${role}">${content}</div>`;
     chatThread.appendChild(msg);
     chatThread.scrollTop = chatThread.scrollHeight;
+    return msg.firstElementChild;
+}
+
+function updateMessage(bubble, text) {
+    bubble.innerHTML = formatAssistantText(text);
+    chatThread.scrollTop = chatThread.scrollHeight;
 }
 
 async function apiPost(path, body) {
@@ -70,6 +76,28 @@ async function apiPost(path, body) {
 	return res.json();
 }
 
+// Streams a plain-text response, calling onText with the text received so far
+async function apiStream(path, body, onText) {
+	const res = await fetch(`${window.API_BASE}${path}`, {
+		method: 'POST',
+		headers: { 'Content-Type': 'application/json' },
+		body: JSON.stringify(body)
+	});
+	if (!res.ok) throw new Error(await res.text());
+	const reader = res.body.getReader();
+	const decoder = new TextDecoder();
+	let text = '';
+	while (true) {
+		const { done, value } = await reader.read();
+		if (done) break;
+		text += decoder.decode(value, { stream: true });
+		onText(text);
+	}
+	text += decoder.decode();
+	onText(text);
+	return text;
+}
+
 function renderPaperResponse(html) {
     // Server returns markdown-like text; render minimally and robustly
     // Identify question blocks by "**Question N:**" markers
@@ -154,12 +182,12 @@ chatForm.addEventListener('submit', async (e) => {
             // Quiz flow
             const topicMatch = text.match(/(?:quiz|test)\s+me\s+(?:on|about)\s+(.+)/i);
             const topic = topicMatch && topicMatch[1] ? topicMatch[1].trim() : text;
-            const { quiz } = await apiPost('/api/quiz', { sessionId: window.SESSION_ID, topic });
-            appendMessage('assistant', quiz);
+            const bubble = appendMessage('assistant', '');
+            await apiStream('/api/quiz/stream', { sessionId: window.SESSION_ID, topic }, (t) => updateMessage(bubble, t));
         } else {
             // Default QA
-            const { answer } = await apiPost('/api/qa', { sessionId: window.SESSION_ID, message: text });
-            appendMessage('assistant', answer);
+            const bubble = appendMessage('assistant', '');
+            await apiStream('/api/qa/stream', { sessionId: window.SESSION_ID, message: text }, (t) => updateMessage(bubble, t));
         }
     } catch (e) {
 		appendMessage('assistant', 'Something went wrong.');